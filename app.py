@@ -1,4 +1,8 @@
+import io
 import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import chainlit as cl
 
@@ -9,7 +13,7 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 
 # Librerías para RAG
 from langchain_community.document_loaders import PyPDFDirectoryLoader
@@ -18,9 +22,10 @@ from langchain_community.vectorstores import Chroma
 from langchain_core.runnables import RunnableParallel
 
 # Módulos personalizados
-from rag_manager import initialize_vector_store
+from rag_manager import initialize_vector_store, RAGConfig
 import security
-from bcrp_api import get_economic_context, BCRPClient
+from bcrp_api import aget_economic_context, is_pure_economic_query, warm_up as warm_up_bcrp, BCRPClient
+from semantic_cache import SemanticCache
 
 
 # --- 1. CONFIGURACIÓN ---
@@ -28,8 +33,43 @@ load_dotenv()
 if not os.getenv("OPENAI_API_KEY"):
     raise ValueError("Por favor configura tu OPENAI_API_KEY en el archivo .env")
 
+LOG_FILE = os.getenv("FINANBOT_LOG_FILE", "finanbot.log")
+
+
+# Logs de la app en un archivo (no se mezclan con la salida de Chainlit)
+_log = security._queued_file_logger(
+    "finanbot",
+    LOG_FILE,
+    logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+)
+
+# El cliente BCRP escribe en el mismo archivo, por la misma cola
+_bcrp_log = logging.getLogger("bcrp")
+for _handler in _log.handlers:
+    _bcrp_log.addHandler(_handler)
+_bcrp_log.setLevel(logging.INFO)
+_bcrp_log.propagate = False
+
 # --- 2. DEFINICIÓN DEL MODELO Y PROMPT ---
-llm = ChatOpenAI(model="gpt-4o", temperature=0, streaming=True)
+# El prefijo estático del prompt se mantiene idéntico entre llamadas para que
+# OpenAI lo reutilice desde su caché de prompts (menor costo y TTFT)
+PROMPT_CACHE_KEY = "finanbot_v1"
+
+llm = ChatOpenAI(
+    model="gpt-4o",
+    temperature=0,
+    streaming=True,
+    model_kwargs={"extra_body": {"prompt_cache_key": PROMPT_CACHE_KEY}}
+)
+
+# Número de fragmentos del LLM agrupados por cada envío al cliente
+STREAM_BATCH_SIZE = 4
+
+# Ventana de memoria: últimos 8 turnos (usuario + asistente) enviados al LLM
+MAX_HISTORY_MESSAGES = 16
+
+# Caché semántico compartido entre sesiones (respuestas a consultas parafraseadas)
+semantic_cache = SemanticCache()
 
 system_prompt_with_rag = """
 Eres "FinanBot", un Asesor Financiero experto y empático especializado en el mercado bancario de Perú. Tu misión es democratizar la asesoría financiera, ayudando a los usuarios a mejorar su salud económica y recomendando productos bancarios adecuados a su perfil.
@@ -78,27 +118,79 @@ INSTRUCCIONES DE COMPORTAMIENTO:
     * Aclara siempre que eres una IA de orientación y que la aprobación final depende de la entidad financiera.
     * Si detectas estrés financiero grave (deudas impagables), sugiere consolidación de deuda o asesoría legal con empatía.
 
+TU OBJETIVO FINAL:
+Que el usuario termine la conversación sintiéndose más inteligente financieramente y con una hoja de ruta clara sobre qué producto contratar. Antes de responder, DEBES pensar paso a paso.
+"""
+
+# Lo único que cambia en cada turno: va al final, después del historial
+context_prompt = """
 --- CONTEXTO DE DOCUMENTOS Y DATOS ECONÓMICOS ---
 {context}
 --- FIN DEL CONTEXTO ---
-
-TU OBJETIVO FINAL:
-Que el usuario termine la conversación sintiéndose más inteligente financieramente y con una hoja de ruta clara sobre qué producto contratar. Antes de responder, DEBES pensar paso a paso.
 """
 
-# Prompt con placeholders para RAG y conversación
+# Prompt con placeholders para RAG y conversación.
+# Orden pensado para la caché de prompts: instrucciones fijas -> historial
+# (solo crece al final) -> contexto del turno -> pregunta
 prompt_with_rag = ChatPromptTemplate.from_messages([
     ("system", system_prompt_with_rag),
     MessagesPlaceholder(variable_name="history"),
+    ("system", context_prompt),
     ("human", "{input}")
 ])
 
 # --- 4. FUNCIONES AUXILIARES PARA EL CHAIN ---
+
+# Precalentamiento de la conexión con el BCRP (una vez por proceso)
+_bcrp_warmup_task = None
+
+# Consultas que omitieron la búsqueda RAG (todas las sesiones), para ajustar
+# is_pure_economic_query a partir de finanbot.log
+_rag_stats = {"consultas": 0, "omitidas": 0}
+
+# Retriever compartido por todas las sesiones: el índice se carga una vez por
+# proceso, en segundo plano desde que se importa el módulo
+_rag_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-init")
+_retriever_future = _rag_executor.submit(initialize_vector_store)
+
+
+async def get_shared_retriever():
+    """
+    Espera, sin bloquear el event loop, a que el retriever compartido esté listo.
+    Si la carga falló, la sesión sigue sin RAG y la siguiente vuelve a intentarlo
+    """
+    global _retriever_future
+    future = _retriever_future
+    try:
+        return await asyncio.wrap_future(future)
+    except Exception as e:
+        print(f"Error inicializando la base de conocimiento: {e}")
+        # Solo una sesión reprograma la carga, aunque varias vean el mismo error
+        if _retriever_future is future:
+            _retriever_future = _rag_executor.submit(initialize_vector_store)
+        return None
+
+def trim_history(memory: BaseChatMessageHistory):
+    """Conserva solo los últimos MAX_HISTORY_MESSAGES mensajes de la sesión"""
+    if len(memory.messages) > MAX_HISTORY_MESSAGES:
+        memory.messages = memory.messages[-MAX_HISTORY_MESSAGES:]
+
+
+_DOC_TEMPLATE = "Documento {i}:\n{content}"
+
+
 def format_docs(docs):
     """Formatea los documentos recuperados para el prompt"""
     if not docs:
         return "No se encontró información relevante en los documentos."
-    return "\n\n".join([f"Documento {i+1}:\n{doc.page_content}" for i, doc in enumerate(docs)])
+    
+    buf = io.StringIO()
+    for i, doc in enumerate(docs, 1):
+        if i > 1:
+            buf.write("\n\n")
+        # Ningún fragmento útil supera el tamaño de chunk del índice
+        buf.write(_DOC_TEMPLATE.format(i=i, content=doc.page_content[:RAGConfig.CHUNK_SIZE]))
+    return buf.getvalue()
 
 # --- 5. GESTIÓN DE EVENTOS CHAINLIT ---
 
@@ -108,12 +200,16 @@ async def on_chat_start():
     Se ejecuta una vez cuando un nuevo usuario abre la página.
     Inicializa RAG y memoria conversacional.
     """
+    global _bcrp_warmup_task
+    if _bcrp_warmup_task is None:
+        _bcrp_warmup_task = asyncio.create_task(warm_up_bcrp())
+    
     # Mostrar mensaje de carga
     loading_msg = cl.Message(content="🔧 Inicializando sistema de conocimiento...")
     await loading_msg.send()
     
     # 1. Inicializar Vector Store (RAG)
-    retriever = initialize_vector_store()
+    retriever = await get_shared_retriever()
     
     # Remover mensaje de carga
     await loading_msg.remove()
@@ -127,7 +223,7 @@ async def on_chat_start():
         ).send()
         
         # Chain sin RAG pero CON datos del BCRP
-        def add_bcrp_only_context(inputs):
+        async def add_bcrp_only_context(inputs):
             """Agrega contexto del BCRP"""
             query = inputs.get("input", "")
             history = inputs.get("history", [])
@@ -135,7 +231,7 @@ async def on_chat_start():
             context_parts = ["No hay documentos PDF disponibles."]
             
             # Obtener datos económicos del BCRP si es relevante
-            bcrp_context = get_economic_context(query)
+            bcrp_context = await aget_economic_context(query)
             if bcrp_context:
                 context_parts.append(bcrp_context)
             
@@ -146,7 +242,7 @@ async def on_chat_start():
             }
         
         chain = (
-            add_bcrp_only_context
+            RunnableLambda(add_bcrp_only_context)
             | prompt_with_rag 
             | llm 
             | StrOutputParser()
@@ -156,7 +252,7 @@ async def on_chat_start():
         await cl.Message(content="✅ Sistema de conocimiento activado (RAG + BCRP)").send()
         
         # Función para agregar contexto RAG + BCRP
-        def add_rag_and_bcrp_context(inputs):
+        async def add_rag_and_bcrp_context(inputs):
             """
             Agrega contexto de RAG + BCRP al input.
             RunnableWithMessageHistory ya habrá agregado 'history'.
@@ -164,15 +260,29 @@ async def on_chat_start():
             query = inputs.get("input", "")
             history = inputs.get("history", [])
             
-            context_parts = []
+            # Consultas solo sobre datos del BCRP no necesitan buscar en documentos
+            skip_rag = is_pure_economic_query(query)
+            _rag_stats["consultas"] += 1
             
-            # 1. Recuperar documentos relevantes (RAG)
-            docs = retriever.invoke(query)
-            rag_context = format_docs(docs)
-            context_parts.append(rag_context)
+            if skip_rag:
+                _rag_stats["omitidas"] += 1
+                _log.info(
+                    "RAG omitido (%d de %d consultas): %s",
+                    _rag_stats["omitidas"], _rag_stats["consultas"], query[:100]
+                )
+                docs = []
+                bcrp_context = await aget_economic_context(query)
+            else:
+                # Recuperar documentos (RAG) y datos del BCRP en paralelo
+                docs, bcrp_context = await asyncio.gather(
+                    retriever.ainvoke(query),
+                    aget_economic_context(query)
+                )
             
-            # 2. Obtener datos económicos del BCRP si es relevante
-            bcrp_context = get_economic_context(query)
+            # 1. Contexto de documentos relevantes (RAG)
+            context_parts = [format_docs(docs)]
+            
+            # 2. Datos económicos del BCRP si es relevante
             if bcrp_context:
                 context_parts.append(bcrp_context)
             
@@ -185,7 +295,7 @@ async def on_chat_start():
         
         # Chain con RAG + BCRP: primero agrega contexto, luego genera respuesta
         chain = (
-            add_rag_and_bcrp_context
+            RunnableLambda(add_rag_and_bcrp_context)
             | prompt_with_rag 
             | llm 
             | StrOutputParser()
@@ -235,18 +345,16 @@ async def on_message(message: cl.Message):
     # PASO 1: VALIDACIÓN DE SEGURIDAD - INPUT
     # ========================================
     
-    # Sanitizar datos sensibles del mensaje
-    sanitized_message = security.sanitize_financial_data(message.content)
-    
-    # Verificar palabras/patrones prohibidos
-    is_blocked, tipo, detalle = security.check_input(sanitized_message)
+    # Sanitizar datos sensibles y verificar palabras/patrones prohibidos
+    scan = security.scan_message(message.content)
+    sanitized_message = scan.sanitized
     
-    if is_blocked:
+    if scan.blocked:
         # Registrar evento de seguridad
         security.log_security_event(
             event_type="input_blocked",
-            user_message=message.content,
-            blocked_content=detalle
+            user_message=sanitized_message,
+            blocked_content=scan.reason
         )
         
         # Enviar respuesta de bloqueo
@@ -255,9 +363,7 @@ async def on_message(message: cl.Message):
         return
     
     # Validar contexto financiero (opcional - comentado para permitir más flexibilidad)
-    # is_valid_context, reason = security.validate_financial_context(sanitized_message)
-    # 
-    # if not is_valid_context:
+    # if not scan.is_financial:
     #     await cl.Message(
     #         content="🤔 Parece que tu consulta no está relacionada con finanzas. "
     #                 "Soy un asesor financiero especializado. ¿Puedo ayudarte con temas de "
@@ -266,24 +372,70 @@ async def on_message(message: cl.Message):
     #     return
     
     # ========================================
-    # PASO 2: PROCESAR CON EL AGENTE
+    # PASO 2: CACHÉ SEMÁNTICO
+    # ========================================
+    
+    # El caché es compartido entre sesiones: solo se usa en el primer turno,
+    # cuando la respuesta no depende del historial de este usuario
+    memory = cl.user_session.get("memory")
+    cacheable = not memory.messages and not semantic_cache.bypass_cache(sanitized_message)
+    query_embedding = None
+    cached_response = None
+    
+    if cacheable:
+        query_embedding = await cl.make_async(semantic_cache.embed)(sanitized_message)
+        # Sin embedding (error de la API) se responde igual, sin caché
+        cacheable = query_embedding is not None
+    
+    if cacheable:
+        cached_response = await cl.make_async(semantic_cache.lookup)(
+            sanitized_message, embedding=query_embedding
+        )
+    
+    if cached_response:
+        msg = cl.Message(content="")
+        for chunk in semantic_cache.iter_chunks(cached_response):
+            await msg.stream_token(chunk)
+        await msg.send()
+        
+        # Registrar el intercambio en la memoria de la sesión
+        memory.add_user_message(sanitized_message)
+        memory.add_ai_message(cached_response)
+        trim_history(memory)
+        return
+    
+    # ========================================
+    # PASO 3: PROCESAR CON EL AGENTE
     # ========================================
     
     agent = cl.user_session.get("agent")
     msg = cl.Message(content="")
     
     # Acumular la respuesta completa para validarla
-    full_response = ""
+    parts = []
+    # Fragmentos aún no enviados: se agrupan para reducir envíos por websocket
+    pending = []
     
     async for chunk in agent.astream(
         {"input": sanitized_message},
         config={"configurable": {"session_id": "current_session"}}
     ):
-        full_response += chunk
-        await msg.stream_token(chunk)
+        parts.append(chunk)
+        pending.append(chunk)
+        if len(pending) >= STREAM_BATCH_SIZE:
+            await msg.stream_token("".join(pending))
+            pending.clear()
+    
+    if pending:
+        await msg.stream_token("".join(pending))
+    
+    full_response = "".join(parts)
+    
+    # Acotar el historial que se reenviará en el próximo turno
+    trim_history(memory)
     
     # ========================================
-    # PASO 3: VALIDACIÓN DE SEGURIDAD - OUTPUT
+    # PASO 4: VALIDACIÓN DE SEGURIDAD - OUTPUT
     # ========================================
     
     is_blocked_out, tipo_out, detalle_out = security.check_output(full_response)
@@ -292,7 +444,7 @@ async def on_message(message: cl.Message):
         # Registrar evento de seguridad
         security.log_security_event(
             event_type="output_blocked",
-            user_message=message.content,
+            user_message=sanitized_message,
             blocked_content=detalle_out
         )
         
@@ -305,7 +457,13 @@ async def on_message(message: cl.Message):
         return
     
     # ========================================
-    # PASO 4: ENVIAR RESPUESTA VALIDADA
+    # PASO 5: ENVIAR RESPUESTA VALIDADA
     # ========================================
     
-    await msg.send()
\ No newline at end of file
+    await msg.send()
+    
+    # Guardar en caché solo respuestas validadas de turnos sin historial
+    if cacheable:
+        await cl.make_async(semantic_cache.put)(
+            sanitized_message, full_response, embedding=query_embedding
+        )
@@ -3,11 +3,23 @@ Módulo de Integración con la API del BCRP (Banco Central de Reserva del Perú)
 Permite obtener series estadísticas macroeconómicas actualizadas
 """
 
+import re
+import time
+import unicodedata
+import logging
+import threading
 import requests
-from typing import Optional, List, Dict, Any
+import httpx
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime, timedelta
 import json
 
+_log = logging.getLogger("bcrp")
+
+
 # =========================================================================
 # CONFIGURACIÓN
 # =========================================================================
@@ -18,6 +30,17 @@ class BCRPConfig:
     DEFAULT_FORMAT = "json"
     DEFAULT_LANGUAGE = "esp"  # esp o ing
     TIMEOUT = 10  # segundos
+    POOL_CONNECTIONS = 4
+    POOL_MAXSIZE = 8
+    MAX_RETRIES = 2  # reintentos ante 502/503/504
+    RETRY_BACKOFF = 0.3  # segundos
+    ASYNC_MAX_KEEPALIVE = 8  # conexiones ociosas del cliente asíncrono
+    ASYNC_MAX_CONNECTIONS = 16
+    CACHE_TTL = 3600  # segundos; las series se actualizan como máximo a diario
+    CACHE_MAX_SIZE = 128  # entradas (LRU)
+    
+    # Ventana (en días) para consultas de "último valor", según frecuencia de la serie
+    LATEST_WINDOW_DAYS = {"D": 60, "M": 120, "Q": 365, "A": 730}
 
 
 # =========================================================================
@@ -95,6 +118,51 @@ SERIES_DESCRIPTIONS = {
 }
 
 
+# Series combinadas para consultas "general": tipo de cambio (0:3) + tasas (3:6)
+TC_AND_TASAS_SERIES = [
+    SeriesCodes.TIPO_CAMBIO_PROMEDIO,
+    SeriesCodes.TIPO_CAMBIO_COMPRA,
+    SeriesCodes.TIPO_CAMBIO_VENTA,
+    SeriesCodes.TASA_REFERENCIA_BCRP,
+    SeriesCodes.TAMN_DEPOSITOS,
+    SeriesCodes.TAMEX_DEPOSITOS,
+]
+
+
+# =========================================================================
+# CACHÉ EN MEMORIA DE RESPUESTAS
+# =========================================================================
+
+# clave -> (timestamp, respuesta); compartido por todas las instancias del cliente
+_BCRP_CACHE: "OrderedDict[tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_BCRP_CACHE_LOCK = threading.Lock()
+
+
+def _cache_get(key: tuple, ttl: int) -> Optional[Dict[str, Any]]:
+    """Retorna la respuesta cacheada si existe y no ha vencido"""
+    with _BCRP_CACHE_LOCK:
+        entry = _BCRP_CACHE.get(key)
+        if entry is None:
+            return None
+        
+        stored_at, data = entry
+        if time.time() - stored_at > ttl:
+            del _BCRP_CACHE[key]
+            return None
+        
+        _BCRP_CACHE.move_to_end(key)
+        return data
+
+
+def _cache_put(key: tuple, data: Dict[str, Any], max_size: int):
+    """Guarda una respuesta, descartando la menos usada si se excede el tamaño"""
+    with _BCRP_CACHE_LOCK:
+        _BCRP_CACHE[key] = (time.time(), data)
+        _BCRP_CACHE.move_to_end(key)
+        while len(_BCRP_CACHE) > max_size:
+            _BCRP_CACHE.popitem(last=False)
+
+
 # =========================================================================
 # CLASE PRINCIPAL
 # =========================================================================
@@ -110,6 +178,25 @@ class BCRPClient:
             config: Configuración personalizada
         """
         self.config = config or BCRPConfig()
+        
+        # Sesión con keep-alive: reutiliza la conexión TLS entre consultas
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.config.POOL_CONNECTIONS,
+            pool_maxsize=self.config.POOL_MAXSIZE,
+            max_retries=Retry(
+                total=self.config.MAX_RETRIES,
+                backoff_factor=self.config.RETRY_BACKOFF,
+                status_forcelist=[502, 503, 504]
+            )
+        )
+        self.session.mount("https://", adapter)
+    
+    @classmethod
+    def invalidate_cache(cls):
+        """Vacía el caché de respuestas compartido"""
+        with _BCRP_CACHE_LOCK:
+            _BCRP_CACHE.clear()
     
     def get_series(
         self,
@@ -117,7 +204,8 @@ class BCRPClient:
         output_format: str = "json",
         start_period: Optional[str] = None,
         end_period: Optional[str] = None,
-        language: str = "esp"
+        language: str = "esp",
+        latest_only: bool = False
     ) -> Dict[str, Any]:
         """
         Obtiene datos de una o más series del BCRP
@@ -128,6 +216,8 @@ class BCRPClient:
             start_period: Periodo inicial (formato: YYYY-MM para mensual, YYYY-Q para trimestral)
             end_period: Periodo final
             language: Idioma ('esp' o 'ing')
+            latest_only: Si es True y no se indica periodo, pide solo una ventana
+                reciente de la serie en lugar del historial completo
             
         Returns:
             Diccionario con los datos de la API
@@ -136,10 +226,109 @@ class BCRPClient:
             ValueError: Si se proporcionan más de 10 series
             requests.RequestException: Si hay error en la petición
         """
+        if latest_only and start_period is None and output_format == "json":
+            start, end = self._latest_window(series_codes)
+            data = self.get_series(series_codes, output_format, start, end, language)
+            # Un error se devuelve tal cual: reintentar solo duplicaría la espera
+            if "error" in data or data.get("periods"):
+                return data
+            # Ventana sin datos (serie con rezago): consultar el historial completo
+        
+        url = self._build_url(series_codes, output_format, start_period, end_period, language)
+        
+        # Consultar caché
+        key = (tuple(series_codes), output_format, start_period, end_period, language)
+        cached = _cache_get(key, self.config.CACHE_TTL)
+        if cached is not None:
+            return cached
+        
+        # Hacer petición
+        try:
+            response = self.session.get(url, timeout=self.config.TIMEOUT)
+            response.raise_for_status()
+            
+            if output_format == "json":
+                data = response.json()
+            else:
+                data = {"raw": response.text}
+            
+            _cache_put(key, data, self.config.CACHE_MAX_SIZE)
+            return data
+                
+        except requests.RequestException as e:
+            _log.warning("Error consultando API BCRP: %s", e)
+            return {"error": str(e)}
+    
+    async def aget_series(
+        self,
+        series_codes: List[str],
+        output_format: str = "json",
+        start_period: Optional[str] = None,
+        end_period: Optional[str] = None,
+        language: str = "esp",
+        latest_only: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Versión asíncrona de get_series (no bloquea el event loop)
+        
+        Args:
+            series_codes: Lista de códigos de series (máximo 10)
+            output_format: Formato de salida (json, xml, csv, etc.)
+            start_period: Periodo inicial
+            end_period: Periodo final
+            language: Idioma ('esp' o 'ing')
+            latest_only: Si es True y no se indica periodo, pide solo una ventana reciente
+            
+        Returns:
+            Diccionario con los datos de la API
+        """
+        if latest_only and start_period is None and output_format == "json":
+            start, end = self._latest_window(series_codes)
+            data = await self.aget_series(series_codes, output_format, start, end, language)
+            # Un error se devuelve tal cual: reintentar solo duplicaría la espera
+            if "error" in data or data.get("periods"):
+                return data
+        
+        url = self._build_url(series_codes, output_format, start_period, end_period, language)
+        
+        key = (tuple(series_codes), output_format, start_period, end_period, language)
+        cached = _cache_get(key, self.config.CACHE_TTL)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await _ASYNC_HTTP_CLIENT.get(url, timeout=self.config.TIMEOUT)
+            response.raise_for_status()
+            
+            if output_format == "json":
+                data = response.json()
+            else:
+                data = {"raw": response.text}
+            
+            _cache_put(key, data, self.config.CACHE_MAX_SIZE)
+            return data
+                
+        except httpx.HTTPError as e:
+            _log.warning("Error consultando API BCRP: %s", e)
+            return {"error": str(e)}
+    
+    def _build_url(
+        self,
+        series_codes: List[str],
+        output_format: str,
+        start_period: Optional[str],
+        end_period: Optional[str],
+        language: str
+    ) -> str:
+        """
+        Construye la URL de consulta a la API
+        
+        Raises:
+            ValueError: Si se proporcionan más de 10 series
+        """
         if len(series_codes) > 10:
             raise ValueError("Máximo 10 series por consulta")
         
-        # Construir URL
         series_str = "-".join(series_codes)
         url_parts = [self.config.BASE_URL, series_str, output_format]
         
@@ -151,21 +340,31 @@ class BCRPClient:
         if language != "esp":
             url_parts.append(language)
         
-        url = "/".join(url_parts)
+        return "/".join(url_parts)
+    
+    def _latest_window(self, series_codes: List[str]) -> Tuple[str, str]:
+        """
+        Calcula (periodo_inicial, periodo_final) para pedir solo datos recientes
         
-        # Hacer petición
-        try:
-            response = requests.get(url, timeout=self.config.TIMEOUT)
-            response.raise_for_status()
-            
-            if output_format == "json":
-                return response.json()
-            else:
-                return {"raw": response.text}
-                
-        except requests.RequestException as e:
-            print(f"Error consultando API BCRP: {e}")
-            return {"error": str(e)}
+        La frecuencia se toma del último carácter del código de la serie
+        (D diaria, M mensual, Q trimestral, A anual); todas las series de
+        una misma consulta deben compartir frecuencia.
+        """
+        frequency = series_codes[0][-1]
+        window = self.config.LATEST_WINDOW_DAYS.get(frequency, self.config.LATEST_WINDOW_DAYS["D"])
+        end = datetime.now()
+        start = end - timedelta(days=window)
+        
+        if frequency == "M":
+            return f"{start.year}-{start.month}", f"{end.year}-{end.month}"
+        if frequency == "Q":
+            return (
+                f"{start.year}-{(start.month - 1) // 3 + 1}",
+                f"{end.year}-{(end.month - 1) // 3 + 1}"
+            )
+        if frequency == "A":
+            return str(start.year), str(end.year)
+        return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
     
     def get_latest_value(self, series_code: str) -> Optional[Dict[str, Any]]:
         """
@@ -178,27 +377,21 @@ class BCRPClient:
             Diccionario con periodo y valor, o None si hay error
         """
         try:
-            data = self.get_series([series_code])
-            
-            if "periods" in data and data["periods"]:
-                periods = data["periods"]
-                last_period = periods[-1]
-                
-                # Obtener el nombre de la serie
-                series_name = data.get("config", {}).get("series", [{}])[0].get("name", series_code)
-                
-                return {
-                    "serie": series_name,
-                    "codigo": series_code,
-                    "periodo": last_period.get("name"),
-                    "valor": last_period.get("values", [None])[0],
-                    "descripcion": SERIES_DESCRIPTIONS.get(series_code, "")
-                }
+            data = self.get_series([series_code], latest_only=True)
+            return self._parse_latest_value(data, series_code)
             
+        except Exception as e:
+            _log.warning("Error obteniendo último valor: %s", e)
             return None
+    
+    async def aget_latest_value(self, series_code: str) -> Optional[Dict[str, Any]]:
+        """Versión asíncrona de get_latest_value"""
+        try:
+            data = await self.aget_series([series_code], latest_only=True)
+            return self._parse_latest_value(data, series_code)
             
         except Exception as e:
-            print(f"Error obteniendo último valor: {e}")
+            _log.warning("Error obteniendo último valor: %s", e)
             return None
     
     def get_tipo_cambio(self) -> Optional[Dict[str, Any]]:
@@ -213,23 +406,25 @@ class BCRPClient:
                 SeriesCodes.TIPO_CAMBIO_PROMEDIO,
                 SeriesCodes.TIPO_CAMBIO_COMPRA,
                 SeriesCodes.TIPO_CAMBIO_VENTA
-            ])
-            
-            if "periods" in data and data["periods"]:
-                last_period = data["periods"][-1]
-                values = last_period.get("values", [])
-                
-                return {
-                    "fecha": last_period.get("name"),
-                    "promedio": values[0] if len(values) > 0 else None,
-                    "compra": values[1] if len(values) > 1 else None,
-                    "venta": values[2] if len(values) > 2 else None
-                }
+            ], latest_only=True)
+            return self._parse_tipo_cambio(data)
             
+        except Exception as e:
+            _log.warning("Error obteniendo tipo de cambio: %s", e)
             return None
+    
+    async def aget_tipo_cambio(self) -> Optional[Dict[str, Any]]:
+        """Versión asíncrona de get_tipo_cambio"""
+        try:
+            data = await self.aget_series([
+                SeriesCodes.TIPO_CAMBIO_PROMEDIO,
+                SeriesCodes.TIPO_CAMBIO_COMPRA,
+                SeriesCodes.TIPO_CAMBIO_VENTA
+            ], latest_only=True)
+            return self._parse_tipo_cambio(data)
             
         except Exception as e:
-            print(f"Error obteniendo tipo de cambio: {e}")
+            _log.warning("Error obteniendo tipo de cambio: %s", e)
             return None
     
     def get_tasas_interes(self) -> Optional[Dict[str, Any]]:
@@ -244,25 +439,53 @@ class BCRPClient:
                 SeriesCodes.TASA_REFERENCIA_BCRP,
                 SeriesCodes.TAMN_DEPOSITOS,
                 SeriesCodes.TAMEX_DEPOSITOS
-            ])
-            
-            if "periods" in data and data["periods"]:
-                last_period = data["periods"][-1]
-                values = last_period.get("values", [])
-                
-                return {
-                    "fecha": last_period.get("name"),
-                    "tasa_referencia": values[0] if len(values) > 0 else None,
-                    "tamn_depositos": values[1] if len(values) > 1 else None,
-                    "tamex_depositos": values[2] if len(values) > 2 else None
-                }
+            ], latest_only=True)
+            return self._parse_tasas_interes(data)
             
+        except Exception as e:
+            _log.warning("Error obteniendo tasas de interés: %s", e)
             return None
+    
+    async def aget_tasas_interes(self) -> Optional[Dict[str, Any]]:
+        """Versión asíncrona de get_tasas_interes"""
+        try:
+            data = await self.aget_series([
+                SeriesCodes.TASA_REFERENCIA_BCRP,
+                SeriesCodes.TAMN_DEPOSITOS,
+                SeriesCodes.TAMEX_DEPOSITOS
+            ], latest_only=True)
+            return self._parse_tasas_interes(data)
             
         except Exception as e:
-            print(f"Error obteniendo tasas de interés: {e}")
+            _log.warning("Error obteniendo tasas de interés: %s", e)
             return None
     
+    def get_tc_and_tasas_bundle(self) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Obtiene tipo de cambio y tasas de interés en una sola petición
+        (la API acepta hasta 10 series por URL)
+        
+        Returns:
+            Tupla (tipo_cambio, tasas_interes); cada elemento puede ser None
+        """
+        try:
+            data = self.get_series(TC_AND_TASAS_SERIES, latest_only=True)
+            return self._split_tc_and_tasas(data)
+            
+        except Exception as e:
+            _log.warning("Error obteniendo tipo de cambio y tasas: %s", e)
+            return None, None
+    
+    async def aget_tc_and_tasas_bundle(self) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Versión asíncrona de get_tc_and_tasas_bundle"""
+        try:
+            data = await self.aget_series(TC_AND_TASAS_SERIES, latest_only=True)
+            return self._split_tc_and_tasas(data)
+            
+        except Exception as e:
+            _log.warning("Error obteniendo tipo de cambio y tasas: %s", e)
+            return None, None
+    
     def get_inflacion(self) -> Optional[Dict[str, Any]]:
         """
         Obtiene datos de inflación
@@ -272,6 +495,70 @@ class BCRPClient:
         """
         return self.get_latest_value(SeriesCodes.INFLACION_ANUAL)
     
+    async def aget_inflacion(self) -> Optional[Dict[str, Any]]:
+        """Versión asíncrona de get_inflacion"""
+        return await self.aget_latest_value(SeriesCodes.INFLACION_ANUAL)
+    
+    # ---------------------------------------------------------------------
+    # Parseo de respuestas (compartido por las versiones sync y async)
+    # ---------------------------------------------------------------------
+    
+    @staticmethod
+    def _parse_latest_value(data: Dict[str, Any], series_code: str) -> Optional[Dict[str, Any]]:
+        """Extrae el último periodo de una serie individual"""
+        if "periods" in data and data["periods"]:
+            last_period = data["periods"][-1]
+            
+            # Obtener el nombre de la serie
+            series_name = data.get("config", {}).get("series", [{}])[0].get("name", series_code)
+            
+            return {
+                "serie": series_name,
+                "codigo": series_code,
+                "periodo": last_period.get("name"),
+                "valor": last_period.get("values", [None])[0],
+                "descripcion": SERIES_DESCRIPTIONS.get(series_code, "")
+            }
+        
+        return None
+    
+    @staticmethod
+    def _parse_tipo_cambio(data: Dict[str, Any], offset: int = 0) -> Optional[Dict[str, Any]]:
+        """Extrae promedio, compra y venta a partir de la posición `offset`"""
+        if "periods" in data and data["periods"]:
+            last_period = data["periods"][-1]
+            values = last_period.get("values", [])[offset:offset + 3]
+            
+            return {
+                "fecha": last_period.get("name"),
+                "promedio": values[0] if len(values) > 0 else None,
+                "compra": values[1] if len(values) > 1 else None,
+                "venta": values[2] if len(values) > 2 else None
+            }
+        
+        return None
+    
+    @staticmethod
+    def _parse_tasas_interes(data: Dict[str, Any], offset: int = 0) -> Optional[Dict[str, Any]]:
+        """Extrae tasa de referencia, TAMN y TAMEX a partir de la posición `offset`"""
+        if "periods" in data and data["periods"]:
+            last_period = data["periods"][-1]
+            values = last_period.get("values", [])[offset:offset + 3]
+            
+            return {
+                "fecha": last_period.get("name"),
+                "tasa_referencia": values[0] if len(values) > 0 else None,
+                "tamn_depositos": values[1] if len(values) > 1 else None,
+                "tamex_depositos": values[2] if len(values) > 2 else None
+            }
+        
+        return None
+    
+    @classmethod
+    def _split_tc_and_tasas(cls, data: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Separa la respuesta combinada: values[0:3] tipo de cambio, values[3:6] tasas"""
+        return cls._parse_tipo_cambio(data, offset=0), cls._parse_tasas_interes(data, offset=3)
+    
     def format_for_prompt(self, data: Dict[str, Any]) -> str:
         """
         Formatea datos del BCRP para incluir en el prompt del LLM
@@ -313,10 +600,88 @@ class BCRPClient:
         return "\n".join(formatted_parts)
 
 
+# Cliente compartido por el chatbot: su pool de conexiones persiste entre mensajes
+_DEFAULT_CLIENT = BCRPClient()
+
+# Cliente HTTP asíncrono compartido; HTTP/2 multiplexa las consultas en una conexión
+_ASYNC_HTTP_CLIENT = httpx.AsyncClient(
+    timeout=BCRPConfig.TIMEOUT,
+    http2=True,
+    limits=httpx.Limits(
+        max_keepalive_connections=BCRPConfig.ASYNC_MAX_KEEPALIVE,
+        max_connections=BCRPConfig.ASYNC_MAX_CONNECTIONS
+    )
+)
+
+
+async def warm_up():
+    """
+    Abre la conexión con el BCRP (DNS + TLS) antes de la primera consulta real,
+    para que ese costo no recaiga en el primer mensaje del usuario
+    """
+    try:
+        await _ASYNC_HTTP_CLIENT.head(BCRPConfig.BASE_URL)
+    except httpx.HTTPError as e:
+        _log.warning("Error precalentando conexión BCRP: %s", e)
+
+
 # =========================================================================
 # FUNCIONES HELPER PARA INTEGRACIÓN CON CHATBOT
 # =========================================================================
 
+# Palabras clave por tipo de consulta
+ECONOMIC_QUERY_KEYWORDS = {
+    "tipo_cambio": ["tipo de cambio", "dolar", "dólar", "tc", "cambio dolar"],
+    "tasas": ["tasa de interes", "tasa de interés", "tamn", "tamex", "tasa referencia"],
+    "inflacion": ["inflacion", "inflación", "ipc"],
+    "general": ["datos económicos", "indicadores económicos", "estadísticas bcrp"]
+}
+
+# Una alternación compilada por categoría (una sola pasada en el motor de regex)
+_ECONOMIC_QUERY_PATTERNS = {
+    query_type: re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+    for query_type, keywords in ECONOMIC_QUERY_KEYWORDS.items()
+}
+
+# Productos y temas cubiertos por los documentos: si aparecen, la consulta
+# también necesita RAG. No incluye términos propios de las series del BCRP
+# ("tasa", "interés", "dólares"...), que sí admiten omitir la búsqueda
+PRODUCT_KEYWORDS = [
+    "préstamo", "crédito", "ahorro", "ahorrar", "inversión", "invertir", "banco",
+    "cuenta", "tarjeta", "deuda", "plazo fijo", "hipoteca", "seguro", "tcea", "trea",
+    "cts", "afp", "fondo", "etf", "depósito", "bono", "acción", "acciones",
+    "presupuesto", "financiero", "ley", "sbs", "smv", "reglamento",
+    "mercado de valores", "bolsa"
+]
+
+
+def _strip_accents(text: str) -> str:
+    """Quita tildes ("depósito" -> "deposito") para aceptar ambas escrituras"""
+    return "".join(
+        c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn"
+    )
+
+
+# Prefijo de palabra: "fondo" cubre "fondos", "ley" cubre "leyes"
+_PRODUCT_PATTERN = re.compile(
+    r"\b(?:" + "|".join(
+        map(re.escape, sorted({kw for k in PRODUCT_KEYWORDS for kw in (k, _strip_accents(k))}))
+    ) + ")",
+    re.IGNORECASE
+)
+
+# Palabras completas: "tc" no debe coincidir dentro de "etc." o "tcea"
+_PURE_ECONOMIC_PATTERN = re.compile(
+    r"\b(?:" + "|".join(
+        map(re.escape, (kw for keywords in ECONOMIC_QUERY_KEYWORDS.values() for kw in keywords))
+    ) + r")\b",
+    re.IGNORECASE
+)
+
+# Las consultas largas suelen combinar datos del BCRP con otras preguntas
+PURE_ECONOMIC_MAX_WORDS = 15
+
+
 def detect_economic_query(message: str) -> Optional[str]:
     """
     Detecta si una consulta requiere datos del BCRP
@@ -327,23 +692,35 @@ def detect_economic_query(message: str) -> Optional[str]:
     Returns:
         Tipo de consulta detectada o None
     """
-    message_lower = message.lower()
-    
-    # Patrones de consulta
-    patterns = {
-        "tipo_cambio": ["tipo de cambio", "dolar", "dólar", "tc", "cambio dolar"],
-        "tasas": ["tasa de interes", "tasa de interés", "tamn", "tamex", "tasa referencia"],
-        "inflacion": ["inflacion", "inflación", "ipc"],
-        "general": ["datos económicos", "indicadores económicos", "estadísticas bcrp"]
-    }
-    
-    for query_type, keywords in patterns.items():
-        if any(keyword in message_lower for keyword in keywords):
+    # Se evalúan en orden: la primera categoría que coincide gana
+    for query_type, pattern in _ECONOMIC_QUERY_PATTERNS.items():
+        if pattern.search(message):
             return query_type
     
     return None
 
 
+def is_pure_economic_query(message: str) -> bool:
+    """
+    Detecta consultas que se responden solo con datos del BCRP
+    (p. ej. "¿cuál es el tipo de cambio hoy?"), sin necesidad de documentos.
+    Es conservadora: ante cualquier término financiero, se busca en documentos
+    
+    Args:
+        message: Mensaje del usuario
+        
+    Returns:
+        True si es una consulta económica corta sin productos financieros
+    """
+    if len(message.split()) > PURE_ECONOMIC_MAX_WORDS:
+        return False
+    
+    if _PRODUCT_PATTERN.search(message):
+        return False
+    
+    return _PURE_ECONOMIC_PATTERN.search(message) is not None
+
+
 def get_economic_context(message: str) -> str:
     """
     Obtiene contexto económico relevante según la consulta
@@ -359,38 +736,84 @@ def get_economic_context(message: str) -> str:
     if not query_type:
         return ""
     
-    client = BCRPClient()
-    context_parts = ["--- DATOS ECONÓMICOS ACTUALIZADOS (BCRP) ---\n"]
+    client = _DEFAULT_CLIENT
     
     try:
         if query_type == "tipo_cambio":
-            data = client.get_tipo_cambio()
-            if data:
-                context_parts.append(client.format_for_prompt(data))
+            results = [client.get_tipo_cambio()]
         
         elif query_type == "tasas":
-            data = client.get_tasas_interes()
-            if data:
-                context_parts.append(client.format_for_prompt(data))
+            results = [client.get_tasas_interes()]
         
         elif query_type == "inflacion":
-            data = client.get_inflacion()
-            if data:
-                context_parts.append(client.format_for_prompt(data))
+            results = [client.get_inflacion()]
         
         elif query_type == "general":
-            # Obtener múltiples indicadores
-            tc = client.get_tipo_cambio()
-            tasas = client.get_tasas_interes()
-            
-            if tc:
-                context_parts.append(client.format_for_prompt(tc))
-            if tasas:
-                context_parts.append("\n" + client.format_for_prompt(tasas))
+            # Tipo de cambio y tasas en una sola petición
+            results = list(client.get_tc_and_tasas_bundle())
         
-        context_parts.append("\nFuente: Banco Central de Reserva del Perú (BCRP)")
-        return "\n".join(context_parts)
+        return _format_economic_context(client, results)
     
     except Exception as e:
-        print(f"Error obteniendo contexto económico: {e}")
-        return ""
\ No newline at end of file
+        _log.warning("Error obteniendo contexto económico: %s", e)
+        return ""
+
+
+async def aget_economic_context(message: str) -> str:
+    """
+    Versión asíncrona de get_economic_context
+    
+    Args:
+        message: Mensaje del usuario
+        
+    Returns:
+        Contexto económico formateado
+    """
+    query_type = detect_economic_query(message)
+    
+    if not query_type:
+        return ""
+    
+    client = _DEFAULT_CLIENT
+    
+    try:
+        if query_type == "tipo_cambio":
+            results = [await client.aget_tipo_cambio()]
+        
+        elif query_type == "tasas":
+            results = [await client.aget_tasas_interes()]
+        
+        elif query_type == "inflacion":
+            results = [await client.aget_inflacion()]
+        
+        elif query_type == "general":
+            # Tipo de cambio y tasas en una sola petición
+            results = list(await client.aget_tc_and_tasas_bundle())
+        
+        return _format_economic_context(client, results)
+    
+    except Exception as e:
+        _log.warning("Error obteniendo contexto económico: %s", e)
+        return ""
+
+
+def _format_economic_context(client: BCRPClient, results: List[Optional[Dict[str, Any]]]) -> str:
+    """
+    Arma el bloque de contexto económico a partir de los datos obtenidos
+    
+    Args:
+        client: Cliente usado para formatear cada resultado
+        results: Datos obtenidos (los None se omiten)
+        
+    Returns:
+        Contexto económico formateado
+    """
+    context_parts = ["--- DATOS ECONÓMICOS ACTUALIZADOS (BCRP) ---\n"]
+    
+    for i, data in enumerate(results):
+        if data:
+            prefix = "\n" if i > 0 else ""
+            context_parts.append(prefix + client.format_for_prompt(data))
+    
+    context_parts.append("\nFuente: Banco Central de Reserva del Perú (BCRP)")
+    return "\n".join(context_parts)
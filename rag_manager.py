@@ -4,9 +4,19 @@ Maneja la carga, procesamiento y consulta de documentos PDF
 """
 
 import os
+import glob
+import hashlib
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
 from typing import Optional, List
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.document_loaders import PyPDFDirectoryLoader
+import numpy as np
+import torch
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
@@ -19,10 +29,26 @@ class RAGConfig:
     """Configuración del sistema RAG"""
     PDF_DIRECTORY = "./documentos_financieros"
     CHROMA_DB_PATH = "./chroma_db"
-    EMBEDDING_MODEL = "text-embedding-3-small"
+    EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # Local, 384 dimensiones
+    EMBEDDING_BATCH_SIZE = 64
+    EMBEDDING_CACHE_DIR = "./.emb_cache"  # Embeddings de fragmentos ya calculados
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 200
-    RETRIEVER_K = 4  # Número de documentos a recuperar
+    PDF_LOAD_WORKERS = int(os.environ.get("PDF_LOAD_WORKERS", max((os.cpu_count() or 1) - 1, 1)))
+    RETRIEVER_K = 3  # Número de documentos a recuperar
+    RETRIEVER_FETCH_K = 10  # Candidatos evaluados por MMR
+    MMR_LAMBDA = 0.5  # 1 = solo relevancia, 0 = máxima diversidad
+    QUERY_CACHE_SIZE = 256  # Consultas recientes recordadas por retrieve_context
+    QUERY_CACHE_THRESHOLD = 0.92  # Similitud coseno mínima para reutilizar un contexto
+    MANIFEST_FILE = ".manifest"  # Huella de los PDFs indexados (dentro de CHROMA_DB_PATH)
+    
+    # Los embeddings están normalizados: distancia coseno en el índice HNSW
+    COLLECTION_METADATA = {
+        "hnsw:space": "cosine",
+        "hnsw:M": 32,
+        "hnsw:construction_ef": 200,
+        "hnsw:search_ef": 64,
+    }
 
 
 # =========================================================================
@@ -35,67 +61,18 @@ def initialize_vector_store():
     Compatible con app.py existente.
     
     Carga PDFs, los divide en chunks y crea/carga el vector store.
-    Solo procesa PDFs si el vector store no existe.
+    Solo procesa PDFs si el índice no existe o si los documentos cambiaron
+    desde la última indexación.
     
     Returns:
         Retriever configurado o None si no hay documentos
     """
-    config = RAGConfig()
-    embeddings = OpenAIEmbeddings(model=config.EMBEDDING_MODEL)
-    
-    # Si ya existe la base de datos, la cargamos
-    if os.path.exists(config.CHROMA_DB_PATH):
-        print("📚 Cargando base de conocimiento existente...")
-        vectorstore = Chroma(
-            persist_directory=config.CHROMA_DB_PATH,
-            embedding_function=embeddings
-        )
-        return vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": config.RETRIEVER_K}
-        )
+    manager = RAGManager()
     
-    # Si no existe, procesamos los PDFs
-    print("🔄 Procesando documentos PDF...")
-    
-    # Verificar que exista la carpeta de PDFs
-    if not os.path.exists(config.PDF_DIRECTORY):
-        os.makedirs(config.PDF_DIRECTORY)
-        print(f"⚠️  Carpeta '{config.PDF_DIRECTORY}' creada. Por favor, agrega tus PDFs ahí.")
+    if not manager.initialize():
         return None
     
-    # Cargar PDFs
-    loader = PyPDFDirectoryLoader(config.PDF_DIRECTORY)
-    documents = loader.load()
-    
-    if not documents:
-        print(f"⚠️  No se encontraron PDFs en '{config.PDF_DIRECTORY}'")
-        return None
-    
-    print(f"✅ {len(documents)} páginas cargadas")
-    
-    # Dividir en chunks optimizados para contenido financiero
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=config.CHUNK_SIZE,
-        chunk_overlap=config.CHUNK_OVERLAP,
-        separators=["\n\n", "\n", ". ", " ", ""],
-    )
-    splits = text_splitter.split_documents(documents)
-    print(f"📄 {len(splits)} fragmentos creados")
-    
-    # Crear vector store
-    vectorstore = Chroma.from_documents(
-        documents=splits,
-        embedding=embeddings,
-        persist_directory=config.CHROMA_DB_PATH
-    )
-    
-    print("💾 Base de conocimiento guardada exitosamente")
-    
-    return vectorstore.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": config.RETRIEVER_K}
-    )
+    return manager.get_retriever()
 
 
 # Alias para compatibilidad
@@ -106,6 +83,10 @@ rag_manager = initialize_vector_store
 # CLASE PRINCIPAL RAG MANAGER (Alternativa avanzada)
 # =========================================================================
 
+# Plantilla de cada documento recuperado en el contexto del prompt
+_DOC_TEMPLATE = "--- Documento {i} ---\nFuente: {source} (Página {page})\nContenido:\n{content}\n"
+
+
 class RAGManager:
     """Gestiona todo el ciclo de vida del sistema RAG"""
     
@@ -117,9 +98,29 @@ class RAGManager:
             config: Configuración personalizada (opcional)
         """
         self.config = config or RAGConfig()
-        self.embeddings = OpenAIEmbeddings(model=self.config.EMBEDDING_MODEL)
+        base_embeddings = HuggingFaceEmbeddings(
+            model_name=self.config.EMBEDDING_MODEL,
+            model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"},
+            encode_kwargs={
+                "normalize_embeddings": True,
+                "batch_size": self.config.EMBEDDING_BATCH_SIZE
+            }
+        )
+        
+        # Al reindexar solo se calculan los fragmentos nuevos o modificados
+        self.embeddings = CacheBackedEmbeddings.from_bytes_store(
+            base_embeddings,
+            LocalFileStore(self.config.EMBEDDING_CACHE_DIR),
+            namespace=self.config.EMBEDDING_MODEL
+        )
         self.vectorstore = None
         self.retriever = None
+        
+        # Caché semántico de consultas: embeddings normalizados (N, dim) y su
+        # contexto formateado, como buffer circular de QUERY_CACHE_SIZE entradas
+        self._cache_embs: Optional[np.ndarray] = None
+        self._cache_ctx: List[str] = []
+        self._cache_next = 0
     
     def initialize(self) -> bool:
         """
@@ -129,20 +130,18 @@ class RAGManager:
         Returns:
             True si se inicializó correctamente, False si no hay documentos
         """
-        # Si ya existe la base de datos, cargarla
-        if os.path.exists(self.config.CHROMA_DB_PATH):
+        # Si el índice persistido corresponde a los PDFs actuales, cargarlo
+        if self._index_is_current():
             print("📚 Cargando base de conocimiento existente...")
             self.vectorstore = Chroma(
                 persist_directory=self.config.CHROMA_DB_PATH,
-                embedding_function=self.embeddings
-            )
-            self.retriever = self.vectorstore.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": self.config.RETRIEVER_K}
+                embedding_function=self.embeddings,
+                collection_metadata=self.config.COLLECTION_METADATA
             )
+            self.retriever = self._create_retriever()
             return True
         
-        # Si no existe, procesar PDFs
+        # Si no existe o está desactualizado, procesar PDFs
         return self._process_documents()
     
     def _process_documents(self) -> bool:
@@ -154,58 +153,149 @@ class RAGManager:
         """
         print("🔄 Procesando documentos PDF...")
         
-        # Verificar que exista la carpeta de PDFs
-        if not os.path.exists(self.config.PDF_DIRECTORY):
-            os.makedirs(self.config.PDF_DIRECTORY)
-            print(f"⚠️  Carpeta '{self.config.PDF_DIRECTORY}' creada.")
+        # Crear la carpeta de PDFs si falta (idempotente)
+        os.makedirs(self.config.PDF_DIRECTORY, exist_ok=True)
+        
+        # Cargar y dividir PDFs (página a página, sin retener el documento completo)
+        pdf_files = self._list_pdf_files()
+        
+        if not pdf_files:
+            print(f"⚠️  No se encontraron PDFs en '{self.config.PDF_DIRECTORY}'")
             print("   Por favor, agrega tus PDFs ahí y reinicia.")
             return False
         
-        # Cargar PDFs
-        loader = PyPDFDirectoryLoader(self.config.PDF_DIRECTORY)
-        documents = loader.load()
+        splits = self._load_and_split_parallel(pdf_files)
         
-        if not documents:
-            print(f"⚠️  No se encontraron PDFs en '{self.config.PDF_DIRECTORY}'")
+        if not splits:
+            print(f"⚠️  Los PDFs de '{self.config.PDF_DIRECTORY}' no contienen texto")
             return False
         
-        print(f"✅ {len(documents)} páginas cargadas")
+        print(f"📄 {len(splits)} fragmentos creados a partir de {len(pdf_files)} PDFs")
         
-        # Dividir en chunks
-        splits = self._split_documents(documents)
-        print(f"📄 {len(splits)} fragmentos creados")
+        # Descartar un índice desactualizado para no duplicar fragmentos
+        shutil.rmtree(self.config.CHROMA_DB_PATH, ignore_errors=True)
         
         # Crear vector store
         self.vectorstore = Chroma.from_documents(
             documents=splits,
             embedding=self.embeddings,
-            persist_directory=self.config.CHROMA_DB_PATH
+            persist_directory=self.config.CHROMA_DB_PATH,
+            collection_metadata=self.config.COLLECTION_METADATA
         )
         
-        self.retriever = self.vectorstore.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": self.config.RETRIEVER_K}
-        )
+        self.retriever = self._create_retriever()
+        self._write_manifest()
+        self._clear_query_cache()
         
         print("💾 Base de conocimiento guardada exitosamente")
         return True
     
-    def _split_documents(self, documents: List[Document]) -> List[Document]:
+    def _create_retriever(self):
+        """
+        Crea el retriever sobre el vector store cargado
+        
+        Returns:
+            Retriever de LangChain
+        """
+        # MMR evita llenar el prompt con fragmentos casi duplicados
+        return self.vectorstore.as_retriever(
+            search_type="mmr",
+            search_kwargs={
+                "k": self.config.RETRIEVER_K,
+                "fetch_k": self.config.RETRIEVER_FETCH_K,
+                "lambda_mult": self.config.MMR_LAMBDA
+            }
+        )
+    
+    def _compute_manifest(self) -> str:
+        """
+        Calcula la huella de los documentos y de la configuración de indexado
+        
+        Returns:
+            SHA256 de nombres y contenido de los PDFs, junto con el modelo de
+            embeddings, los parámetros de división y del índice
+        """
+        digest = hashlib.sha256()
+        digest.update(
+            f"{self.config.EMBEDDING_MODEL}|{self.config.CHUNK_SIZE}|{self.config.CHUNK_OVERLAP}|"
+            f"{sorted(self.config.COLLECTION_METADATA.items())}".encode()
+        )
+        
+        # Contenido y no fecha de modificación: git fija la fecha al hacer
+        # checkout, y un clon nuevo no debe reindexar PDFs idénticos
+        for path in self._list_pdf_files():
+            digest.update(os.path.relpath(path, self.config.PDF_DIRECTORY).encode() + b"\0")
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        
+        return digest.hexdigest()
+    
+    def _manifest_path(self) -> str:
+        """Ruta del archivo de manifiesto dentro de la base de datos"""
+        return os.path.join(self.config.CHROMA_DB_PATH, self.config.MANIFEST_FILE)
+    
+    def _index_is_current(self) -> bool:
+        """
+        Verifica si el índice persistido corresponde a los PDFs actuales
+        
+        Returns:
+            True si existe un manifiesto y coincide con la huella actual
+        """
+        try:
+            with open(self._manifest_path(), encoding="utf-8") as f:
+                return f.read().strip() == self._compute_manifest()
+        except OSError:
+            return False
+    
+    def _write_manifest(self):
+        """Guarda la huella de los documentos recién indexados"""
+        with open(self._manifest_path(), "w", encoding="utf-8") as f:
+            f.write(self._compute_manifest())
+    
+    def _list_pdf_files(self) -> List[str]:
         """
-        Divide documentos en chunks optimizados
+        Lista los PDFs de la carpeta de documentos (recursivo, sin ocultos)
+        
+        Returns:
+            Rutas ordenadas de los archivos PDF
+        """
+        pattern = os.path.join(self.config.PDF_DIRECTORY, "**", "*.pdf")
+        return sorted(
+            path for path in glob.glob(pattern, recursive=True)
+            if not os.path.basename(path).startswith(".")
+        )
+    
+    def _load_and_split_parallel(self, pdf_files: List[str]) -> List[Document]:
+        """
+        Carga y divide los PDFs repartiendo los archivos entre varios procesos
+        (el parseo con pypdf es intensivo en CPU). Cada proceso divide las
+        páginas a medida que las lee, así que nunca se retienen todas las
+        páginas sin dividir en memoria.
         
         Args:
-            documents: Lista de documentos a dividir
+            pdf_files: Rutas de los PDFs a procesar
             
         Returns:
-            Lista de documentos divididos en chunks
+            Fragmentos de todos los PDFs, en orden de archivo
         """
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.config.CHUNK_SIZE,
-            chunk_overlap=self.config.CHUNK_OVERLAP,
-            separators=["\n\n", "\n", ". ", " ", ""],
-        )
-        return text_splitter.split_documents(documents)
+        workers = min(self.config.PDF_LOAD_WORKERS, len(pdf_files))
+        chunk_sizes = [self.config.CHUNK_SIZE] * len(pdf_files)
+        chunk_overlaps = [self.config.CHUNK_OVERLAP] * len(pdf_files)
+        
+        if workers <= 1:
+            splits = map(_load_and_split_pdf, pdf_files, chunk_sizes, chunk_overlaps)
+            return list(chain.from_iterable(splits))
+        
+        # "spawn": se ejecuta desde un hilo de app.py, con torch y el modelo ya
+        # cargados; hacer fork de un proceso con varios hilos puede bloquear
+        # a los hijos
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            splits = executor.map(_load_and_split_pdf, pdf_files, chunk_sizes, chunk_overlaps)
+            return list(chain.from_iterable(splits))
     
     def retrieve_context(self, query: str) -> str:
         """
@@ -221,12 +311,76 @@ class RAGManager:
             return "No hay documentos disponibles."
         
         try:
-            docs = self.retriever.invoke(query)
-            return self._format_docs(docs)
+            # Un solo embedding por consulta: sirve para el caché y para la búsqueda
+            query_emb = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+            query_emb /= np.linalg.norm(query_emb) or 1.0
+            
+            cached = self._lookup_query_cache(query_emb)
+            if cached is not None:
+                return cached
+            
+            docs = self.vectorstore.max_marginal_relevance_search_by_vector(
+                query_emb.tolist(),
+                k=self.config.RETRIEVER_K,
+                fetch_k=self.config.RETRIEVER_FETCH_K,
+                lambda_mult=self.config.MMR_LAMBDA
+            )
+            formatted = self._format_docs(docs)
+            self._store_query_cache(query_emb, formatted)
+            return formatted
         except Exception as e:
             print(f"Error recuperando contexto: {e}")
             return "Error al recuperar documentos."
     
+    def _lookup_query_cache(self, query_emb: np.ndarray) -> Optional[str]:
+        """
+        Busca un contexto ya recuperado para una consulta casi idéntica
+        
+        Args:
+            query_emb: Embedding normalizado de la consulta
+            
+        Returns:
+            Contexto cacheado o None si ninguna consulta supera el umbral
+        """
+        if not self._cache_ctx:
+            return None
+        
+        # Vectores normalizados: el producto punto es la similitud coseno
+        sims = self._cache_embs[:len(self._cache_ctx)] @ query_emb
+        best = int(np.argmax(sims))
+        
+        if sims[best] >= self.config.QUERY_CACHE_THRESHOLD:
+            return self._cache_ctx[best]
+        return None
+    
+    def _store_query_cache(self, query_emb: np.ndarray, context: str):
+        """
+        Guarda el contexto de una consulta, reemplazando el más antiguo si
+        el buffer está lleno
+        
+        Args:
+            query_emb: Embedding normalizado de la consulta
+            context: Contexto formateado
+        """
+        if self._cache_embs is None:
+            self._cache_embs = np.zeros(
+                (self.config.QUERY_CACHE_SIZE, query_emb.shape[0]), dtype=np.float32
+            )
+        
+        slot = self._cache_next
+        self._cache_embs[slot] = query_emb
+        if slot < len(self._cache_ctx):
+            self._cache_ctx[slot] = context
+        else:
+            self._cache_ctx.append(context)
+        self._cache_next = (slot + 1) % self.config.QUERY_CACHE_SIZE
+    
+    def _clear_query_cache(self):
+        """Descarta los contextos cacheados (p. ej. tras reindexar)"""
+        self._cache_embs = None
+        self._cache_ctx = []
+        self._cache_next = 0
+    
     def _format_docs(self, docs: List[Document]) -> str:
         """
         Formatea documentos recuperados para el prompt
@@ -240,18 +394,15 @@ class RAGManager:
         if not docs:
             return "No se encontró información relevante en los documentos."
         
-        formatted = []
-        for i, doc in enumerate(docs, 1):
-            source = doc.metadata.get('source', 'Desconocido')
-            page = doc.metadata.get('page', 'N/A')
-            
-            formatted.append(
-                f"--- Documento {i} ---\n"
-                f"Fuente: {source} (Página {page})\n"
-                f"Contenido:\n{doc.page_content}\n"
+        return "\n".join([
+            _DOC_TEMPLATE.format(
+                i=i,
+                source=doc.metadata.get('source', 'Desconocido'),
+                page=doc.metadata.get('page', 'N/A'),
+                content=doc.page_content
             )
-        
-        return "\n".join(formatted)
+            for i, doc in enumerate(docs, 1)
+        ])
     
     def get_retriever(self):
         """
@@ -270,11 +421,8 @@ class RAGManager:
         Returns:
             True si se recargaron exitosamente
         """
-        import shutil
-        
         # Eliminar base de datos existente
-        if os.path.exists(self.config.CHROMA_DB_PATH):
-            shutil.rmtree(self.config.CHROMA_DB_PATH)
+        shutil.rmtree(self.config.CHROMA_DB_PATH, ignore_errors=True)
         
         # Reinicializar
         return self._process_documents()
@@ -294,18 +442,18 @@ class RAGManager:
             }
         
         try:
-            # Obtener una muestra de documentos
-            sample_docs = self.vectorstore.similarity_search("", k=100)
+            # Leer solo metadatos del almacenamiento (sin embedding ni búsqueda ANN)
+            raw = self.vectorstore._collection.get(include=["metadatas"])
             
             # Extraer fuentes únicas
-            sources = set()
-            for doc in sample_docs:
-                source = doc.metadata.get('source', 'Desconocido')
-                sources.add(source)
+            sources = {
+                (metadata or {}).get('source', 'Desconocido')
+                for metadata in raw["metadatas"]
+            }
             
             return {
                 "initialized": True,
-                "total_chunks": len(sample_docs),
+                "total_chunks": len(raw["ids"]),
                 "sources": list(sources),
                 "retriever_k": self.config.RETRIEVER_K
             }
@@ -321,6 +469,31 @@ class RAGManager:
 # FUNCIONES DE UTILIDAD
 # =========================================================================
 
+def _load_and_split_pdf(path: str, chunk_size: int, chunk_overlap: int) -> List[Document]:
+    """
+    Carga un PDF página a página y divide cada página en chunks
+    Función de módulo para poder ejecutarse en procesos hijos
+    
+    Args:
+        path: Ruta del archivo PDF
+        chunk_size: Tamaño máximo de cada chunk
+        chunk_overlap: Solapamiento entre chunks
+        
+    Returns:
+        Lista de documentos divididos en chunks
+    """
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ". ", " ", ""],
+    )
+    
+    splits = []
+    for page in PyPDFLoader(path).lazy_load():
+        splits.extend(text_splitter.split_documents([page]))
+    return splits
+
+
 def create_rag_chain_function(rag_manager: RAGManager):
     """
     Crea una función para integrar RAG en un chain de LangChain
@@ -1,5 +1,22 @@
+import json
+import queue
+import time
 import random
 import re
+import atexit
+import threading
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from functools import lru_cache
+from typing import NamedTuple
+import ahocorasick
+
+# RE2 (google-re2) garantiza tiempo lineal: inmune a backtracking catastrófico
+# en respuestas largas o entradas adversarias. Si no está instalado, se usa re
+try:
+    import re2
+except ImportError:
+    re2 = None
 
 # =========================================================================
 # PALABRAS PROHIBIDAS EN INPUT (Usuario)
@@ -93,6 +110,138 @@ patterns_out = [
     r"(evita|evade|esquiva)\s+(impuestos|tributos|sbs)",
 ]
 
+# =========================================================================
+# FILTROS COMPILADOS
+# =========================================================================
+# Las palabras se buscan con un autómata Aho-Corasick (todas a la vez, en una
+# sola pasada en C) y los patrones con una única alternación de regex
+
+def _build_word_automaton(palabras: list) -> ahocorasick.Automaton:
+    """
+    Compila las palabras prohibidas en un autómata Aho-Corasick
+
+    Args:
+        palabras: Palabras prohibidas (se buscan como texto literal)
+
+    Returns:
+        Autómata cuyas claves son las palabras en minúsculas y cuyos
+        valores son las palabras originales
+    """
+    automaton = ahocorasick.Automaton()
+
+    for palabra in palabras:
+        automaton.add_word(palabra.lower(), palabra)
+
+    automaton.make_automaton()
+    return automaton
+
+
+def _build_pattern_screen(patterns: list) -> tuple[re.Pattern, dict]:
+    """
+    Compila los patrones en una alternación con un grupo nombrado por patrón.
+    Se aplica sobre el texto ya convertido a minúsculas (el mismo que usa el
+    autómata), por lo que no necesita re.IGNORECASE
+
+    Args:
+        patterns: Patrones regex prohibidos (en minúsculas)
+
+    Returns:
+        Tupla (regex, grupos) donde grupos mapea el nombre del grupo al patrón
+    """
+    parts = []
+    groups = {}
+
+    for i, pattern in enumerate(patterns):
+        name = f"p{i}"
+        parts.append(f"(?P<{name}>{pattern})")
+        groups[name] = pattern
+
+    return _compile_linear("|".join(parts)), groups
+
+
+def _compile_linear(pattern: str):
+    """
+    Compila un patrón con RE2 si está disponible; si no (o si el patrón usa
+    sintaxis que RE2 no soporta, como lookarounds), con el módulo re
+
+    Args:
+        pattern: Expresión regular
+
+    Returns:
+        Objeto con la interfaz de re.Pattern (search, lastgroup, ...)
+    """
+    if re2 is not None:
+        try:
+            return re2.compile(_to_unicode_classes(pattern))
+        except re2.error:
+            pass
+
+    return re.compile(pattern)
+
+
+# En RE2, \w, \s y \d solo cubren ASCII; en re abarcan Unicode (á, ñ, espacio
+# duro U+00A0, espacios tipográficos, dígitos no latinos). Equivalentes RE2,
+# sin corchetes para poder usarse también dentro de una clase [...]
+_RE2_UNICODE_CLASSES = {
+    "w": r"\pL\pN_",
+    "s": r"\s\p{Z}",
+    "d": r"\p{Nd}",
+}
+
+
+def _to_unicode_classes(pattern: str) -> str:
+    """
+    Traduce \w, \s y \d a sus equivalentes Unicode de RE2, para que el
+    patrón filtre lo mismo que con el módulo re
+
+    Args:
+        pattern: Expresión regular (sintaxis de re)
+
+    Returns:
+        Expresión regular equivalente para RE2
+    """
+    out = []
+    in_class = False
+    i = 0
+
+    while i < len(pattern):
+        char = pattern[i]
+
+        if char == "\\" and i + 1 < len(pattern):
+            escape = pattern[i + 1]
+            if escape in _RE2_UNICODE_CLASSES:
+                chars = _RE2_UNICODE_CLASSES[escape]
+                out.append(chars if in_class else f"[{chars}]")
+            else:
+                out.append(pattern[i:i + 2])
+            i += 2
+            continue
+
+        if char == "[" and not in_class:
+            in_class = True
+            out.append(char)
+            # "]" justo tras "[" o "[^" es un carácter literal de la clase
+            if pattern[i + 1:i + 2] == "^":
+                out.append("^")
+                i += 1
+            if pattern[i + 1:i + 2] == "]":
+                out.append("]")
+                i += 1
+        elif char == "]" and in_class:
+            in_class = False
+            out.append(char)
+        else:
+            out.append(char)
+        i += 1
+
+    return "".join(out)
+
+
+_INPUT_WORDS = _build_word_automaton(palabras_in)
+_OUTPUT_WORDS = _build_word_automaton(palabras_out)
+_INPUT_PATTERNS, _INPUT_GROUPS = _build_pattern_screen(patterns_in)
+_OUTPUT_PATTERNS, _OUTPUT_GROUPS = _build_pattern_screen(patterns_out)
+
 # =========================================================================
 # RESPUESTAS DE BLOQUEO
 # =========================================================================
@@ -117,11 +266,20 @@ responses_output_blocked = [
 # FUNCIONES DE VALIDACIÓN
 # =========================================================================
 
+# Un generador por hilo: no se comparte el estado global del módulo random
+_rng = threading.local()
+
+
 def get_random_response(response_list: list) -> str:
     """Obtiene una respuesta aleatoria de una lista"""
-    return random.choice(response_list)
+    rng = getattr(_rng, "r", None)
+    if rng is None:
+        rng = _rng.r = random.Random()
+    return response_list[rng.randrange(len(response_list))]
 
 
+# Los mensajes se repiten con frecuencia (reintentos, preguntas habituales)
+@lru_cache(maxsize=4096)
 def check_input(message: str) -> tuple[bool, str, str]:
     """
     Verifica si el mensaje del usuario contiene palabras o patrones prohibidos
@@ -134,18 +292,30 @@ def check_input(message: str) -> tuple[bool, str, str]:
         - is_blocked: True si está bloqueado
         - tipo_bloqueo: "palabra" o "patrón"
         - detalle: La palabra o patrón detectado
+
+    Se mantiene por compatibilidad; para mensajes de usuario usar scan_message
     """
-    message_lower = message.lower()
+    return _screen_input(message.lower())
+
 
+def _screen_input(message_lower: str) -> tuple[bool, str, str]:
+    """
+    Busca palabras y patrones prohibidos en un mensaje ya en minúsculas
+
+    Args:
+        message_lower: Mensaje del usuario en minúsculas
+
+    Returns:
+        Tupla (is_blocked, tipo_bloqueo, detalle), como check_input
+    """
     # Verificar palabras prohibidas
-    for palabra in palabras_in:
-        if palabra.lower() in message_lower:
-            return True, "palabra", palabra
+    for _, palabra in _INPUT_WORDS.iter(message_lower):
+        return True, "palabra", palabra
 
     # Verificar patrones regex
-    for pattern in patterns_in:
-        if re.search(pattern, message_lower):
-            return True, "patrón", pattern
+    match = _INPUT_PATTERNS.search(message_lower)
+    if match:
+        return True, "patrón", _INPUT_GROUPS[match.lastgroup]
 
     return False, "", ""
 
@@ -163,18 +333,50 @@ def check_output(response: str) -> tuple[bool, str, str]:
     response_lower = response.lower()
 
     # Verificar palabras prohibidas
-    for palabra in palabras_out:
-        if palabra.lower() in response_lower:
-            return True, "palabra", palabra
+    for _, palabra in _OUTPUT_WORDS.iter(response_lower):
+        return True, "palabra", palabra
 
     # Verificar patrones regex
-    for pattern in patterns_out:
-        if re.search(pattern, response_lower):
-            return True, "patrón", pattern
+    match = _OUTPUT_PATTERNS.search(response_lower)
+    if match:
+        return True, "patrón", _OUTPUT_GROUPS[match.lastgroup]
 
     return False, "", ""
 
 
+# Números de tarjeta (16 dígitos)
+_CARD_PATTERN = r"\b\d{4}[\s-]?\d{4}[\s-]?\d{4}[\s-]?\d{4}\b"
+# Números de cuenta (10-20 dígitos)
+_ACCT_PATTERN = r"\b\d{10,20}\b"
+# Etiquetas de CVV ("cvv", "código", ...)
+_CVV_LABEL_PATTERN = r"cvv|código|code|cvc"
+
+# Tarjeta, cuenta y CVV en una sola pasada. A igual posición gana la primera
+# alternativa: tras una etiqueta de CVV se prueba antes una tarjeta o cuenta
+# completa (que se enmascara conservando la etiqueta); si no la hay, se
+# enmascaran los 3-4 dígitos siguientes como CVV
+_SENSITIVE_DATA = re.compile(
+    rf"(?P<prefix>(?:{_CVV_LABEL_PATTERN})[\s:]+)"
+    rf"(?:(?P<prefix_card>{_CARD_PATTERN})|(?P<prefix_acct>{_ACCT_PATTERN}))"
+    rf"|(?P<card>{_CARD_PATTERN})"
+    rf"|(?P<acct>{_ACCT_PATTERN})"
+    rf"|(?P<cvv_label>{_CVV_LABEL_PATTERN})[\s:]+\d{{3,4}}",
+    re.IGNORECASE
+)
+
+
+def _mask_sensitive_data(match: re.Match) -> str:
+    """Reemplazo para cada dato sensible encontrado por _SENSITIVE_DATA"""
+    if match.group("prefix") is not None:
+        mask = "[TARJETA-OCULTA]" if match.group("prefix_card") else "[CUENTA-OCULTA]"
+        return match.group("prefix") + mask
+    if match.group("card") is not None:
+        return "[TARJETA-OCULTA]"
+    if match.group("acct") is not None:
+        return "[CUENTA-OCULTA]"
+    return f"{match.group('cvv_label')}: [OCULTO]"
+
+
 def sanitize_financial_data(text: str) -> str:
     """
     Sanitiza datos financieros sensibles del texto
@@ -185,19 +387,78 @@ def sanitize_financial_data(text: str) -> str:
         
     Returns:
         Texto con datos sensibles enmascarados
+
+    Se mantiene por compatibilidad; para mensajes de usuario usar scan_message
     """
-    # Patrón para números de tarjeta (16 dígitos)
-    text = re.sub(r'\b\d{4}[\s-]?\d{4}[\s-]?\d{4}[\s-]?\d{4}\b', 
-                  '[TARJETA-OCULTA]', text)
+    return _SENSITIVE_DATA.sub(_mask_sensitive_data, text)
+
+
+SECURITY_LOG_FILE = "security.log"
+
+
+class _JSONFormatter(logging.Formatter):
+    """Formatea cada evento de seguridad como una línea JSON"""
     
-    # Patrón para números de cuenta (10-20 dígitos)
-    text = re.sub(r'\b\d{10,20}\b', '[CUENTA-OCULTA]', text)
+    FIELDS = ("ts", "type", "blocked", "user_msg")
     
-    # Patrón para CVV (3-4 dígitos después de "cvv" o "código")
-    text = re.sub(r'(cvv|código|code|cvc)[\s:]+\d{3,4}', 
-                  r'\1: [OCULTO]', text, flags=re.IGNORECASE)
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(
+            {field: getattr(record, field, None) for field in self.FIELDS},
+            ensure_ascii=False
+        )
+
+
+def _queued_file_logger(name: str, path: str, formatter: logging.Formatter) -> logging.Logger:
+    """
+    Configura un logger que escribe en un archivo a través de una cola:
+    quien registra solo encola y un hilo aparte escribe en disco
+
+    Args:
+        name: Nombre del logger
+        path: Archivo de destino (se crea al escribir el primer registro)
+        formatter: Formato de cada registro
+
+    Returns:
+        Logger configurado
+    """
+    logger = logging.getLogger(name)
+    
+    # Evitar listeners duplicados si el módulo se recarga (chainlit -w)
+    if any(isinstance(h, QueueHandler) for h in logger.handlers):
+        return logger
     
-    return text
+    file_handler = logging.FileHandler(path, encoding="utf-8", delay=True)
+    file_handler.setFormatter(formatter)
+    
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+_sec_log = _queued_file_logger("security", SECURITY_LOG_FILE, _JSONFormatter())
+
+# Último segundo formateado: ráfagas de eventos reutilizan el mismo string
+_last_ts = [0, ""]
+
+
+def _ts() -> str:
+    """
+    Marca de tiempo local con resolución de segundos
+    
+    Returns:
+        Fecha y hora en formato "%Y-%m-%d %H:%M:%S"
+    """
+    now = int(time.time())
+    if now != _last_ts[0]:
+        _last_ts[1] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        _last_ts[0] = now
+    return _last_ts[1]
 
 
 def log_security_event(event_type: str, user_message: str, blocked_content: str):
@@ -206,34 +467,41 @@ def log_security_event(event_type: str, user_message: str, blocked_content: str)
     
     Args:
         event_type: Tipo de evento ("input_blocked", "output_blocked")
-        user_message: Mensaje original del usuario
+        user_message: Mensaje original del usuario (se enmascara antes de
+            escribirlo: el log persiste en disco)
         blocked_content: Contenido que causó el bloqueo
     """
-    # En producción, esto debería ir a un sistema de logging centralizado
-    import datetime
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    log_entry = f"""
-    ========================================
-    [EVENTO DE SEGURIDAD]
-    Timestamp: {timestamp}
-    Tipo: {event_type}
-    Contenido bloqueado: {blocked_content}
-    Mensaje original: {user_message[:100]}...
-    ========================================
-    """
-    
-    print(log_entry)
+    # Enmascarar antes de truncar, para no cortar un número a medio enmascarar
+    user_message = _SENSITIVE_DATA.sub(_mask_sensitive_data, user_message)
     
-    # En producción: guardar en archivo o base de datos
-    # with open("security_logs.txt", "a") as f:
-    #     f.write(log_entry)
+    # Solo se encola el evento; el hilo del listener escribe en disco
+    _sec_log.warning(
+        "",
+        extra={
+            "ts": _ts(),
+            "type": event_type,
+            "blocked": blocked_content,
+            "user_msg": user_message[:100]
+        }
+    )
 
 
 # =========================================================================
 # VALIDACIÓN DE CONTEXTO FINANCIERO
 # =========================================================================
 
+financial_keywords = [
+    "préstamo", "crédito", "ahorro", "inversión", "banco", "cuenta",
+    "tarjeta", "tasa", "interés", "deuda", "plazo fijo", "hipoteca",
+    "seguro", "tcea", "trea", "cts", "afp", "fondos", "dinero",
+    "soles", "dólares", "financiero", "económico", "presupuesto"
+]
+
+# Búsqueda de subcadena, como las palabras prohibidas: "deuda" también cubre
+# "endeudado" y "crédito" cubre "microcrédito", en una sola pasada
+_FIN_WORDS = _build_word_automaton(financial_keywords)
+
+
 def validate_financial_context(message: str) -> tuple[bool, str]:
     """
     Valida que la consulta esté relacionada con finanzas
@@ -244,24 +512,84 @@ def validate_financial_context(message: str) -> tuple[bool, str]:
         
     Returns:
         Tupla (is_valid, reason)
+    
+    Se mantiene por compatibilidad; para mensajes de usuario usar scan_message
     """
-    financial_keywords = [
-        "préstamo", "crédito", "ahorro", "inversión", "banco", "cuenta",
-        "tarjeta", "tasa", "interés", "deuda", "plazo fijo", "hipoteca",
-        "seguro", "tcea", "trea", "cts", "afp", "fondos", "dinero",
-        "soles", "dólares", "financiero", "económico", "presupuesto"
-    ]
+    if not _is_financial(message, message.lower()):
+        return False, "La consulta no parece estar relacionada con finanzas."
     
-    message_lower = message.lower()
+    return True, ""
+
+
+def _is_financial(message: str, message_lower: str) -> bool:
+    """
+    Indica si el mensaje trata sobre finanzas
     
+    Args:
+        message: Mensaje del usuario
+        message_lower: El mismo mensaje en minúsculas
+        
+    Returns:
+        True si es corto o contiene al menos una palabra financiera
+    """
     # Si la consulta es muy corta, asumir que es válida
     if len(message.split()) < 3:
-        return True, ""
+        return True
     
     # Verificar si contiene al menos una palabra financiera
-    has_financial_keyword = any(kw in message_lower for kw in financial_keywords)
+    for _ in _FIN_WORDS.iter(message_lower):
+        return True
     
-    if not has_financial_keyword:
-        return False, "La consulta no parece estar relacionada con finanzas."
+    return False
+
+
+# =========================================================================
+# ANÁLISIS UNIFICADO DE MENSAJES
+# =========================================================================
+
+class SecurityResult(NamedTuple):
+    """Resultado de analizar un mensaje del usuario con scan_message"""
+    blocked: bool  # True si contiene palabras o patrones prohibidos
+    reason: str  # Palabra o patrón que causó el bloqueo ("" si no hay)
+    is_financial: bool  # True si la consulta está relacionada con finanzas
+    sanitized: str  # Mensaje con datos sensibles enmascarados
+
+
+def scan_message(text: str) -> SecurityResult:
+    """
+    Sanitiza y valida un mensaje del usuario en un solo recorrido: enmascara
+    datos sensibles, pasa a minúsculas una vez y sobre ese texto aplica los
+    filtros de entrada y la validación de contexto financiero
+    
+    Args:
+        text: Mensaje original del usuario
+        
+    Returns:
+        SecurityResult con el veredicto y el mensaje sanitizado
+    """
+    return _scan_sanitized(_SENSITIVE_DATA.sub(_mask_sensitive_data, text))
+
+
+# Memoizado sobre el texto ya enmascarado: el caché nunca retiene números de
+# tarjeta o cuenta de los mensajes originales
+@lru_cache(maxsize=4096)
+def _scan_sanitized(sanitized: str) -> SecurityResult:
+    """
+    Aplica los filtros de entrada y la validación de contexto financiero
+    
+    Args:
+        sanitized: Mensaje del usuario con datos sensibles enmascarados
+        
+    Returns:
+        SecurityResult con el veredicto y el mensaje sanitizado
+    """
+    sanitized_lower = sanitized.lower()
+    
+    blocked, _, reason = _screen_input(sanitized_lower)
     
-    return True, ""
\ No newline at end of file
+    return SecurityResult(
+        blocked=blocked,
+        reason=reason,
+        is_financial=_is_financial(sanitized, sanitized_lower),
+        sanitized=sanitized
+    )
@@ -0,0 +1,213 @@
+"""
+Módulo de Caché Semántico
+Reutiliza respuestas previas del LLM para consultas equivalentes (parafraseadas)
+"""
+
+import re
+import time
+import uuid
+from typing import List, Optional
+from langchain_openai import OpenAIEmbeddings
+from langchain_community.vectorstores import Chroma
+
+# =========================================================================
+# CONFIGURACIÓN
+# =========================================================================
+
+class CacheConfig:
+    """Configuración del caché semántico"""
+    COLLECTION_NAME = "semantic_cache"
+    EMBEDDING_MODEL = "text-embedding-3-small"
+    SIMILARITY_THRESHOLD = 0.95  # Similitud coseno mínima para considerar un hit
+    TTL = 3600  # segundos
+    MAX_ENTRIES = 1000  # Al superarse, se descartan las entradas más antiguas
+    STREAM_CHUNK_SIZE = 20  # caracteres por token al reproducir una respuesta cacheada
+
+    # Consultas sobre datos "del momento" no se sirven desde caché (BCRP cambia)
+    BYPASS_KEYWORDS = ["hoy", "ahora", "actual"]
+
+
+_BYPASS_PATTERN = re.compile(
+    r"\b(" + "|".join(map(re.escape, CacheConfig.BYPASS_KEYWORDS)) + r")",
+    re.IGNORECASE
+)
+
+
+# =========================================================================
+# CLASE PRINCIPAL
+# =========================================================================
+
+class SemanticCache:
+    """Caché de respuestas indexado por similitud de embeddings de la consulta"""
+
+    def __init__(self, config: CacheConfig = None):
+        """
+        Inicializa el caché semántico en memoria
+
+        Args:
+            config: Configuración personalizada (opcional)
+        """
+        self.config = config or CacheConfig()
+        self.embeddings = OpenAIEmbeddings(model=self.config.EMBEDDING_MODEL)
+        self.vectorstore = Chroma(
+            collection_name=self.config.COLLECTION_NAME,
+            embedding_function=self.embeddings,
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+
+    def bypass_cache(self, query: str) -> bool:
+        """
+        Indica si la consulta pide datos actuales y no debe servirse desde caché
+
+        Args:
+            query: Consulta del usuario
+
+        Returns:
+            True si la consulta debe ir siempre al LLM
+        """
+        return bool(_BYPASS_PATTERN.search(query))
+
+    def embed(self, query: str) -> Optional[List[float]]:
+        """
+        Calcula el embedding de una consulta, para reutilizarlo en lookup y put
+
+        Args:
+            query: Consulta del usuario
+
+        Returns:
+            Embedding de la consulta o None si falla (el caché se omite)
+        """
+        try:
+            return self.embeddings.embed_query(query)
+        except Exception as e:
+            print(f"Error calculando embedding para caché semántico: {e}")
+            return None
+
+    def lookup(
+        self,
+        query: str,
+        threshold: Optional[float] = None,
+        embedding: Optional[List[float]] = None
+    ) -> Optional[str]:
+        """
+        Busca una respuesta cacheada para una consulta similar
+
+        Args:
+            query: Consulta del usuario
+            threshold: Similitud coseno mínima (por defecto SIMILARITY_THRESHOLD)
+            embedding: Embedding ya calculado de la consulta (opcional)
+
+        Returns:
+            Respuesta cacheada o None si no hay hit
+        """
+        if threshold is None:
+            threshold = self.config.SIMILARITY_THRESHOLD
+
+        if self.bypass_cache(query):
+            return None
+
+        if embedding is None:
+            embedding = self.embed(query)
+            if embedding is None:
+                return None
+
+        try:
+            # Solo entradas vigentes: una vencida no oculta a otra válida
+            results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+                embedding, k=1, filter={"expires_at": {"$gte": time.time()}}
+            )
+        except Exception as e:
+            print(f"Error consultando caché semántico: {e}")
+            return None
+
+        if not results:
+            return None
+
+        doc, distance = results[0]
+
+        # Con espacio coseno, Chroma devuelve distancia = 1 - similitud
+        if 1 - distance < threshold:
+            return None
+
+        return doc.metadata.get("response")
+
+    def put(
+        self,
+        query: str,
+        response: str,
+        ttl: Optional[int] = None,
+        embedding: Optional[List[float]] = None
+    ):
+        """
+        Guarda una respuesta validada en el caché
+
+        Args:
+            query: Consulta del usuario
+            response: Respuesta completa del LLM
+            ttl: Tiempo de vida en segundos (por defecto TTL)
+            embedding: Embedding ya calculado de la consulta (opcional)
+        """
+        if self.bypass_cache(query):
+            return
+
+        ttl = ttl if ttl is not None else self.config.TTL
+        now = time.time()
+        cache_id = str(uuid.uuid4())
+
+        if embedding is None:
+            embedding = self.embed(query)
+            if embedding is None:
+                return
+
+        try:
+            self._evict(now)
+            # Se inserta con el embedding ya calculado en lookup (sin re-embeber)
+            self.vectorstore._collection.add(
+                ids=[cache_id],
+                embeddings=[embedding],
+                documents=[query],
+                metadatas=[{
+                    "cache_id": cache_id,
+                    "response": response,
+                    "ts": now,
+                    "expires_at": now + ttl
+                }]
+            )
+        except Exception as e:
+            print(f"Error guardando en caché semántico: {e}")
+
+    def _evict(self, now: float):
+        """
+        Elimina las entradas vencidas y, si aún se alcanza MAX_ENTRIES, las
+        más antiguas, para dejar espacio a una nueva
+
+        Args:
+            now: Marca de tiempo actual
+        """
+        collection = self.vectorstore._collection
+        collection.delete(where={"expires_at": {"$lt": now}})
+
+        excess = collection.count() - self.config.MAX_ENTRIES + 1
+        if excess <= 0:
+            return
+
+        entries = collection.get(include=["metadatas"])
+        oldest = sorted(
+            zip(entries["ids"], entries["metadatas"]),
+            key=lambda entry: entry[1].get("ts", 0)
+        )[:excess]
+        collection.delete(ids=[cache_id for cache_id, _ in oldest])
+
+    def iter_chunks(self, response: str):
+        """
+        Divide una respuesta cacheada en fragmentos para simular streaming
+
+        Args:
+            response: Respuesta cacheada
+
+        Yields:
+            Fragmentos de STREAM_CHUNK_SIZE caracteres
+        """
+        size = self.config.STREAM_CHUNK_SIZE
+        for i in range(0, len(response), size):
+            yield response[i:i + size]